@@ -0,0 +1,4 @@
+from importlib import import_module
+
+# ``async`` is a reserved word since python3.7, so ``from nswebdav.async import ...`` no longer parses.
+AsyncNutstoreDav = import_module("nswebdav.async").AsyncNutstoreDav
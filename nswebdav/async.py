@@ -1,11 +1,31 @@
 import asyncio
-from urllib.parse import urljoin
+from functools import partial
 
 import aiohttp
 
-from nswebdav.base import NutstoreDavBase
+from nswebdav.base import (NutstoreDavBase, _backoff_delay, _chunks, _copy_entities, _merge_audit_logs, _raise_failures,
+                           _time_slices, _TEAM_MEMBER_BATCH)
 from nswebdav.exceptions import NSWebDavHTTPError
 from nswebdav.parse import *
+from nswebdav.render import render_propfind
+
+_CONNECTOR_DEFAULTS = {
+    "limit": 100,
+    "limit_per_host": 20,
+    "keepalive_timeout": 30,
+    "ttl_dns_cache": 300,
+}
+
+
+class _PrecomputedBasicAuth(aiohttp.BasicAuth):
+    # BasicAuth base64-encodes the credentials on every request.
+    def __new__(cls, login, password="", encoding="latin1"):
+        self = super().__new__(cls, login, password, encoding)
+        self._header = aiohttp.BasicAuth.encode(self)
+        return self
+
+    def encode(self):
+        return self._header
 
 
 class AsyncNutstoreDav(NutstoreDavBase):
@@ -20,22 +40,88 @@ class AsyncNutstoreDav(NutstoreDavBase):
     """
     def __init__(self, base_url="https://dav.jianguoyun.com", dav_url="/dav", operation_url="/nsdav"):
         super().__init__(base_url, dav_url, operation_url)
+
+    def _default_client(self):
         loop = asyncio.get_event_loop()
-        self._client = aiohttp.ClientSession(loop=loop)
+        connector_kwargs = dict(_CONNECTOR_DEFAULTS, **self._connector_kwargs)
+        connector = aiohttp.TCPConnector(loop=loop, **connector_kwargs)
+        return aiohttp.ClientSession(connector=connector, loop=loop)
 
-    def _get_auth_tuple(self, auth_tuple=None):
-        return aiohttp.BasicAuth(*(auth_tuple or self._auth_tuple))
+    def _make_auth(self, auth_tuple):
+        return _PrecomputedBasicAuth(*auth_tuple)
 
     def close(self):
-        self._client.loop.run_until_complete(self._client.close())
+        if self._client is not None:
+            self._client.loop.run_until_complete(self._client.close())
+            self._client = None
+
+    def _discard_client(self):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        # ``run_until_complete`` raises inside a running loop, so close there in the background.
+        if client.loop.is_running():
+            asyncio.ensure_future(client.close(), loop=client.loop)
+        else:
+            client.loop.run_until_complete(client.close())
+
+    async def aclose(self):
+        """
+        Used to close underlying client inside a running event loop.
+        """
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def _gather(self, coros, concurrency, return_exceptions=False):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=return_exceptions)
+
+    async def _with_retry(self, factory, retries, backoff=0.25):
+        # ``factory`` returns a fresh coroutine for each attempt, there is always at least one.
+        attempts = max(retries, 1)
+        for attempt in range(attempts):
+            try:
+                return await factory()
+            except NSWebDavHTTPError as e:
+                if e.code < 500 or attempt == attempts - 1:
+                    raise
+            await asyncio.sleep(_backoff_delay(backoff, attempt))
+
+    async def ls(self, path, auth_tuple=None, client=None, props=None):
+        key = self._ls_cache_key(path, props, auth_tuple, client)
+        cached = self._ls_cache_get(key)
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        data = render_propfind(props) if props else None
+        response = await self._perform_dav_request("PROPFIND", auth_tuple, client, path=path, data=data,
+                                                   headers=headers)
+
+        if response.status == 304 and cached is not None:
+            response.release()
+            return _copy_entities(cached[1])
+        if response.status == 207:
+            result = parse_ls(await response.read())
+            self._ls_cache_set(key, response.headers.get("ETag"), result)
+            return result
+        raise NSWebDavHTTPError(response.status, await response.read())
 
-    async def ls(self, path, auth_tuple=None, client=None):
-        response = await self._perform_dav_request("PROPFIND", auth_tuple, client, path=path)
+    async def ls_tree(self, path, depth="infinity", auth_tuple=None, client=None, props=None):
+        data = render_propfind(props) if props else None
+        response = await self._perform_dav_request("PROPFIND", auth_tuple, client, path=path, data=data,
+                                                   headers={"Depth": depth})
 
         if response.status == 207:
             return parse_ls(await response.read())
         raise NSWebDavHTTPError(response.status, await response.read())
 
+    async def ls_many(self, paths, concurrency=8, auth_tuple=None, client=None, props=None):
+        return await self._gather((self.ls(path, auth_tuple, client, props) for path in paths), concurrency)
+
     async def mkdir(self, path, auth_tuple=None, client=None):
         response = await self._perform_dav_request("MKCOL", auth_tuple, client, path=path)
 
@@ -52,22 +138,44 @@ class AsyncNutstoreDav(NutstoreDavBase):
             return "Overwrite"
         raise NSWebDavHTTPError(response.status, await response.read())
 
-    async def download(self, path, auth_tuple=None, client=None):
+    async def download(self, path, auth_tuple=None, client=None, fp=None, chunk_size=65536):
+        response = await self._perform_dav_request("GET", auth_tuple, client, path=path)
+
+        if response.status == 200:
+            if fp is None:
+                return await response.read()
+            written = 0
+            async for chunk in response.content.iter_chunked(chunk_size):
+                fp.write(chunk)
+                written += len(chunk)
+            return written
+        raise NSWebDavHTTPError(response.status, await response.read())
+
+    async def iter_download(self, path, chunk_size=65536, auth_tuple=None, client=None):
         response = await self._perform_dav_request("GET", auth_tuple, client, path=path)
 
         if response.status == 200:
-            return await response.read()
+            return response.content.iter_chunked(chunk_size)
         raise NSWebDavHTTPError(response.status, await response.read())
 
+    async def mget(self, paths, concurrency=8, auth_tuple=None, client=None):
+        return await self._gather((self.download(path, auth_tuple, client) for path in paths), concurrency)
+
+    async def mput(self, items, concurrency=8, auth_tuple=None, client=None):
+        return await self._gather((self.upload(content, path, auth_tuple, client) for content, path in items),
+                                  concurrency)
+
     async def mv(self, from_path, to_path, auth_tuple=None, client=None):
-        response = await self._perform_dav_request("MOVE", auth_tuple, client, from_path=from_path, to_path=to_path)
+        response = await self._perform_dav_move_request("MOVE", auth_tuple, client,
+                                                        from_path=from_path, to_path=to_path)
 
         if response.status == 201:
             return True
         raise NSWebDavHTTPError(response.status, await response.read())
 
     async def cp(self, from_path, to_path, auth_tuple=None, client=None):
-        response = await self._perform_dav_request("COPY", auth_tuple, client, from_path=from_path, to_path=to_path)
+        response = await self._perform_dav_move_request("COPY", auth_tuple, client,
+                                                        from_path=from_path, to_path=to_path)
 
         if response.status == 201:
             return True
@@ -80,6 +188,9 @@ class AsyncNutstoreDav(NutstoreDavBase):
             return True
         raise NSWebDavHTTPError(response.status, await response.read())
 
+    async def rm_many(self, paths, concurrency=8, auth_tuple=None, client=None):
+        return await self._gather((self.rm(path, auth_tuple, client) for path in paths), concurrency)
+
     async def share(self, path, users=None, groups=None, downloadable=True, auth_tuple=None, client=None):
         path = self._dav_url + path
         response = await self._perform_operation_request("pubObject", auth_tuple, client,
@@ -141,12 +252,18 @@ class AsyncNutstoreDav(NutstoreDavBase):
         raise NSWebDavHTTPError(response.status, await response.read())
 
     async def search(self, keywords, path, auth_tuple=None, client=None):
+        key = self._search_cache_key(keywords, path, auth_tuple, client)
+        result = self._search_cache_get(key)
+        if result is not None:
+            return result
         if path:
             path = self._dav_url + path
         response = await self._perform_operation_request("search", auth_tuple, client,
                                                          keywords=keywords, path=path)
         if response.status == 207:
-            return parse_search(await response.read())
+            result = parse_search(await response.read())
+            self._search_cache_set(key, result)
+            return result
         raise NSWebDavHTTPError(response.status, await response.read())
 
     async def get_content_url(self, path, platform="desktop", link_type="download", auth_tuple=None, client=None):
@@ -170,8 +287,7 @@ class AsyncNutstoreDav(NutstoreDavBase):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/getUserInfo"
+        url = self._operation_urls["getUserInfo"]
         response = await client.request("GET", url, auth=auth_tuple)
 
         if response.status == 200:
@@ -189,8 +305,7 @@ class AsyncNutstoreDav(NutstoreDavBase):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/getTeamMembers"
+        url = self._operation_urls["getTeamMembers"]
         response = await client.request("GET", url, auth=auth_tuple)
 
         if response.status == 200:
@@ -204,6 +319,14 @@ class AsyncNutstoreDav(NutstoreDavBase):
             return True
         raise NSWebDavHTTPError(response.status, await response.read())
 
+    async def create_team_members(self, users, concurrency=8, retries=3, auth_tuple=None, client=None):
+        batches = _chunks(users, _TEAM_MEMBER_BATCH)
+        results = await self._gather((self._with_retry(partial(self.create_team_member, batch, auth_tuple, client),
+                                                       retries)
+                                      for batch in batches), concurrency, return_exceptions=True)
+        _raise_failures(batches, results)
+        return True
+
     async def update_team_member_storage_quota(self, user_name, storage_quota, auth_tuple=None, client=None):
         response = await self._perform_operation_request("updateTeamMemberStorageQuota", auth_tuple, client,
                                                          user_name=user_name, storage_quota=storage_quota)
@@ -259,8 +382,7 @@ class AsyncNutstoreDav(NutstoreDavBase):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/dismissTeam"
+        url = self._operation_urls["dismissTeam"]
         response = await client.request("POST", url, auth=auth_tuple)
 
         if response.status == 204:
@@ -282,3 +404,12 @@ class AsyncNutstoreDav(NutstoreDavBase):
         if response.status == 200:
             return parse_audit_logs(await response.read())
         raise NSWebDavHTTPError(response.status, await response.read())
+
+    async def query_audit_logs_range(self, time_start, time_end, user_name=None, op_type=None, file_name=None,
+                                     slices=8, concurrency=4, retries=3, auth_tuple=None, client=None):
+        parts = _time_slices(time_start, time_end, slices)
+        results = await self._gather((self._with_retry(partial(self.query_audit_logs, start, end, user_name, op_type,
+                                                               file_name, auth_tuple, client), retries)
+                                      for start, end in parts),
+                                     concurrency, return_exceptions=True)
+        return _merge_audit_logs(_raise_failures(parts, results))
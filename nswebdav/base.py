@@ -1,12 +1,102 @@
+import random
+import time
+import warnings
+from functools import lru_cache
+from itertools import chain
 from urllib.parse import urljoin, quote
 
+from nswebdav.exceptions import NSWebDavBatchError
+from nswebdav.parse import Entity
 from nswebdav.render import render_func
 
+_quote_cached = lru_cache(maxsize=1024)(quote)
+
+_SEARCH_CACHE_SIZE = 64
+
+# The server accepts at most this many users per createEtpTeamMember request.
+_TEAM_MEMBER_BATCH = 10
+# Operations sent without a request body.
+_PLAIN_OPERATIONS = ("getUserInfo", "getTeamMembers", "dismissTeam")
+# Operations taking a password, their bodies must not outlive the request in the render cache.
+_SECRET_OPERATIONS = frozenset(("submitCopyPubObject", "directPubContentUrl", "createEtpTeamMember"))
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _backoff_delay(backoff, attempt):
+    # Exponential backoff with a little jitter, so retried requests don't arrive together.
+    return backoff * 2 ** attempt * (1 + random.random() * 0.1)
+
+
+def _time_slices(time_start, time_end, slices):
+    # The server takes both bounds as inclusive milliseconds, so slices must not share a boundary
+    # or logs at that instant come back twice.
+    start = round(time_start * 1000)
+    end = round(time_end * 1000)
+    slices = max(1, min(slices, end - start + 1))
+    step = (end - start + 1) / slices
+    bounds = [start + round(step * i) for i in range(slices)] + [end + 1]
+    return [(low / 1000, (high - 1) / 1000) for low, high in zip(bounds[:-1], bounds[1:])]
+
+
+def _raise_failures(parts, results):
+    failures = [(part, result) for part, result in zip(parts, results) if isinstance(result, BaseException)]
+    if failures:
+        raise NSWebDavBatchError(failures, len(parts))
+    return results
+
+
+def _merge_audit_logs(results):
+    first_times = [r.first_operation_time for r in results if r.first_operation_time is not None]
+    last_times = [r.last_operation_time for r in results if r.last_operation_time is not None]
+    activities = []
+    for r in results:
+        activities.extend(r.activities)
+    return Entity(log_num=sum(r.log_num or 0 for r in results),
+                  first_operation_time=min(first_times) if first_times else None,
+                  last_operation_time=max(last_times) if last_times else None,
+                  has_more=any(r.has_more for r in results),
+                  activities=activities)
+
+
+@lru_cache(maxsize=256)
+def _render_cached(method, render_items):
+    return render_func[method](**{key: value for key, _, value in render_items})
+
+
+def _render(method, render_kwargs):
+    if method in _SECRET_OPERATIONS:
+        return render_func[method](**render_kwargs)
+    try:
+        # ``True``, ``1`` and ``1.0`` are equal keys but render differently, so the type is part of the key.
+        key = frozenset((key, type(value), value) for key, value in render_kwargs.items())
+    except TypeError:
+        # Lists or dicts in the arguments, can't be cached.
+        return render_func[method](**render_kwargs)
+    return _render_cached(method, key)
+
+
+def _copy_entities(entities):
+    # Cached results are shared, so hand out and keep entities nobody else can mutate.
+    return [Entity(entity) for entity in entities]
+
+
+def _absolute(base, url):
+    if url.startswith(("http://", "https://")):
+        return url
+    return urljoin(base, url)
+
 
 class NutstoreDavBase:
     """
     Base class for both sync subclass and async subclass
 
+    The default client is created lazily on first use and reused by every request,
+    so connections are kept alive between calls. Passing a client to each method call
+    bypasses this connection pool, prefer :meth:`.config` for a custom client.
+
     Parameters
     ----------
     base_url : str
@@ -23,13 +113,30 @@ class NutstoreDavBase:
         self._dav_url = dav_url
         self._client = None
         self._auth_tuple = None
-
-    def config(self, client=None, auth_tuple=None, base_url=None, dav_url=None, operation_url=None):
+        self._auth = None
+        self._connector_kwargs = {}
+        self._client_override_warned = False
+        self._search_cache_ttl = 0
+        self._search_cache = {}
+        self._ls_cache_size = 0
+        self._ls_cache = {}
+        # Per-call auth tuples are usually the same few credentials, build their auth objects once.
+        self._auth_for = lru_cache(maxsize=32)(self._make_auth)
+        self._update_roots()
+
+    def config(self, client=None, auth_tuple=None, base_url=None, dav_url=None, operation_url=None,
+               connector_kwargs=None, search_cache_ttl=None, ls_cache_size=None):
         """
         Used to overwrite ``base_url``, ``dav_url`` or ``operation_url``.
 
         Or use custom ``client`` and config global ``auth_tuple``.
 
+        Or tune the connection pool of default client by ``connector_kwargs``.
+
+        Or cache results of :meth:`.search` for ``search_cache_ttl`` seconds.
+
+        Or revalidate up to ``ls_cache_size`` results of :meth:`.ls` by their ETag.
+
         Parameters
         ----------
         client : :class:`aiohttp.ClientSession` or :class:`requests.Session`
@@ -44,18 +151,51 @@ class NutstoreDavBase:
             The dav url of nutstore website, which is used to access files.
         operation_url : str
             The operation url of nutstore website, which is used to post operations.
-        """
+        connector_kwargs : dict
+            Keyword arguments used to build the connection pool of default client.
+            :class:`aiohttp.TCPConnector` for async version, such as ``limit``, ``limit_per_host``
+            and ``keepalive_timeout``.
+            :class:`requests.adapters.HTTPAdapter` for sync version, such as ``pool_connections``,
+            ``pool_maxsize`` and ``max_retries``.
+            Current client will be closed and a new default client will be created on next request.
+            Inside a running event loop, the async version only schedules the close,
+            ``await`` :meth:`.aclose` first to wait for it.
+        search_cache_ttl : float
+            Seconds to reuse the result of an identical :meth:`.search` call, ``0`` disables the cache.
+            The cache is dropped on any ``upload``, ``mkdir``, ``rm``, ``mv`` or ``cp``,
+            and is bypassed when ``auth_tuple`` or ``client`` is passed to :meth:`.search`.
+        ls_cache_size : int
+            The number of :meth:`.ls` results kept with their ``ETag``, ``0`` disables the cache.
+            A cached listing is requested with ``If-None-Match`` and reused when the server answers
+            ``304 Not Modified``. It is bypassed when ``auth_tuple`` or ``client`` is passed to :meth:`.ls`.
+        """
+        if search_cache_ttl is not None:
+            self._search_cache_ttl = search_cache_ttl
+            self._search_cache.clear()
+        if ls_cache_size is not None:
+            self._ls_cache_size = ls_cache_size
+            self._ls_cache.clear()
+        if connector_kwargs:
+            self._discard_client()
+            self._connector_kwargs = connector_kwargs
         if client:
             self.close()
             self._client = client
         if auth_tuple:
             self._auth_tuple = auth_tuple
+            self._auth = self._make_auth(auth_tuple)
+            self._search_cache.clear()
+            self._ls_cache.clear()
         if base_url:
             self._base_url = base_url
         if dav_url:
             self._dav_url = dav_url
         if operation_url:
             self._operation_url = operation_url
+        if base_url or dav_url or operation_url:
+            self._update_roots()
+            self._search_cache.clear()
+            self._ls_cache.clear()
 
     def close(self):
         """
@@ -63,49 +203,111 @@ class NutstoreDavBase:
         """
         raise NotImplementedError("Should be implemented in subclass.")
 
-    def _perform_dav_request(self, method, auth_tuple=None, client=None, **kwargs):
-        auth_tuple = self._get_auth_tuple(auth_tuple)
-        client = self._get_client(client)
-        data = kwargs.get("data")
-        headers = None
-        url = None
-
-        path = kwargs.get("path")
-        if path:
-            root_url = urljoin(self._base_url, self._dav_url)
-            url = root_url + path
+    def _discard_client(self):
+        self.close()
 
-        from_path = kwargs.get("from_path")
-        to_path = kwargs.get("to_path")
-        if from_path and to_path:
-            root_url = urljoin(self._base_url, self._dav_url)
-            url = root_url + from_path
-            destination = root_url + quote(to_path)
+    def _update_roots(self):
+        # urljoin parses both urls, so only do it when they change.
+        self._dav_root = _absolute(self._base_url, self._dav_url)
+        self._operation_root = _absolute(self._base_url, self._operation_url)
+        self._operation_urls = {method: self._operation_root + "/" + method
+                                for method in chain(render_func, _PLAIN_OPERATIONS)}
+        # Rebuilt together with the root, so stale urls never outlive a config change.
+        self._dav_url_for = lru_cache(maxsize=256)(self._dav_root.__add__)
 
-            headers = {
-                "Destination": destination
-            }
+    def _perform_dav_request(self, method, auth_tuple=None, client=None, *, path, data=None, **request_kwargs):
+        auth_tuple = self._get_auth_tuple(auth_tuple)
+        client = self._get_client(client, stacklevel=4)
+        url = self._dav_url_for(path)
+        if method in ("PUT", "MKCOL", "DELETE"):
+            self._search_cache.clear()
+        return client.request(method, url, data=data, auth=auth_tuple, **request_kwargs)
 
-        return client.request(method, url, data=data, headers=headers, auth=auth_tuple)
+    def _perform_dav_move_request(self, method, auth_tuple=None, client=None, *, from_path, to_path):
+        auth_tuple = self._get_auth_tuple(auth_tuple)
+        client = self._get_client(client, stacklevel=4)
+        url = self._dav_url_for(from_path)
+        headers = {
+            "Destination": self._dav_url_for(_quote_cached(to_path))
+        }
+        self._search_cache.clear()
+        return client.request(method, url, headers=headers, auth=auth_tuple)
 
     def _perform_operation_request(self, method, auth_tuple=None, client=None, **render_kwargs):
         auth_tuple = self._get_auth_tuple(auth_tuple)
-        client = self._get_client(client)
-        func = render_func.get(method)
-
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/{method}".format(method=method)
-        data = func(**render_kwargs)
-        data = data.encode("utf-8")
+        client = self._get_client(client, stacklevel=4)
+        url = self._operation_urls[method]
+        data = _render(method, render_kwargs)
         return client.request("POST", url, data=data, auth=auth_tuple)
 
-    def _get_auth_tuple(self, auth_tuple=None):
+    def _search_cache_key(self, keywords, path, auth_tuple, client):
+        if self._search_cache_ttl and auth_tuple is None and client is None:
+            return tuple(keywords), path
+        return None
+
+    def _search_cache_get(self, key):
+        if key is None:
+            return None
+        entry = self._search_cache.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires < time.monotonic():
+            self._search_cache.pop(key, None)
+            return None
+        return _copy_entities(result)
+
+    def _search_cache_set(self, key, result):
+        if key is None:
+            return
+        if key not in self._search_cache and len(self._search_cache) >= _SEARCH_CACHE_SIZE:
+            # Another thread may evict the same entry or empty the cache first.
+            self._search_cache.pop(next(iter(self._search_cache), None), None)
+        self._search_cache[key] = (time.monotonic() + self._search_cache_ttl, tuple(_copy_entities(result)))
+
+    def _ls_cache_key(self, path, props, auth_tuple, client):
+        if self._ls_cache_size and auth_tuple is None and client is None:
+            return path, tuple(props) if props else None
+        return None
+
+    def _ls_cache_get(self, key):
+        # The entry is captured before the request, a concurrent call may evict it while this one waits.
+        return self._ls_cache.get(key) if key is not None else None
+
+    def _ls_cache_set(self, key, etag, result):
+        if key is None or not etag:
+            return
+        if key not in self._ls_cache and len(self._ls_cache) >= self._ls_cache_size:
+            # Another thread of ``ls_many`` may evict the same entry or empty the cache first.
+            self._ls_cache.pop(next(iter(self._ls_cache), None), None)
+        self._ls_cache[key] = (etag, tuple(_copy_entities(result)))
+
+    def _make_auth(self, auth_tuple):
         raise NotImplementedError("Should be implemented in subclass.")
 
-    def _get_client(self, client=None):
-        return client or self._client
+    def _get_auth_tuple(self, auth_tuple=None):
+        if auth_tuple:
+            return self._auth_for(tuple(auth_tuple))
+        return self._auth
+
+    def _default_client(self):
+        raise NotImplementedError("Should be implemented in subclass.")
 
-    def ls(self, path, auth_tuple=None, client=None):
+    def _get_client(self, client=None, stacklevel=3):
+        # ``stacklevel`` points the warning at the caller of the public method,
+        # requests sent through ``_perform_*`` are one frame deeper.
+        if client is not None:
+            if not self._client_override_warned:
+                self._client_override_warned = True
+                warnings.warn("Passing a client to each call bypasses the shared connection pool, "
+                              "use config(client=...) to replace the default client instead.",
+                              UserWarning, stacklevel=stacklevel)
+            return client
+        if self._client is None:
+            self._client = self._default_client()
+        return self._client
+
+    def ls(self, path, auth_tuple=None, client=None, props=None):
         """
         List the items under given path.
 
@@ -117,6 +319,10 @@ class NutstoreDavBase:
             The auth_tuple overriding global config.
         client : :class:`aiohttp.ClientSession`
             The client overriding global config.
+        props : list
+            A list of DAV property names such as ``["getlastmodified", "getcontentlength"]``.
+            Only these properties are requested, the values of others will be :obj:`None` or :obj:`False`.
+            :obj:`None` means all properties.
 
         Returns
         -------
@@ -151,6 +357,64 @@ class NutstoreDavBase:
         """
         raise NotImplementedError
 
+    def ls_tree(self, path, depth="infinity", auth_tuple=None, client=None, props=None):
+        """
+        List the items under given path recursively with a single request.
+
+        Parameters
+        ----------
+        path : str
+            The absolute path of object such as ``/path/to/directory/object``
+        depth : str
+            The ``Depth`` header sent with the request, ``"infinity"`` lists the whole tree.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+        props : list
+            A list of DAV property names, see :meth:`.ls`.
+
+        Returns
+        -------
+        :obj:`list`
+            A list contains :class:`.Entity` for every item in the tree, with the same values as :meth:`.ls`.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
+    def ls_many(self, paths, concurrency=8, auth_tuple=None, client=None, props=None):
+        """
+        List the items under each of given paths concurrently.
+
+        Parameters
+        ----------
+        paths : list
+            A list of absolute paths such as ``/path/to/directory/object``.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+        props : list
+            A list of DAV property names, see :meth:`.ls`.
+
+        Returns
+        -------
+        :obj:`list`
+            A list contains the result of :meth:`.ls` for each path, in the same order as ``paths``.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
     def mkdir(self, path, auth_tuple=None, client=None):
         """
         Create a directory to given path.
@@ -182,8 +446,9 @@ class NutstoreDavBase:
 
         Parameters
         ----------
-        content : bytes
-            The bytes of uploaded object.
+        content : bytes or file object
+            The bytes of uploaded object. A file object or an iterable of bytes is streamed
+            without being read into memory, for async version an async iterable is also accepted.
         path : str
             The absolute path of object such as ``/path/to/directory/object``
         auth_tuple : tuple
@@ -203,7 +468,7 @@ class NutstoreDavBase:
         """
         raise NotImplementedError
 
-    def download(self, path, auth_tuple=None, client=None):
+    def download(self, path, auth_tuple=None, client=None, fp=None, chunk_size=65536):
         """
         Download an object from given path.
 
@@ -215,11 +480,97 @@ class NutstoreDavBase:
             The auth_tuple overriding global config.
         client : :class:`aiohttp.ClientSession`
             The client overriding global config.
+        fp : file object
+            If given, the object is written into it chunk by chunk instead of being buffered in memory.
+        chunk_size : int
+            The size of each chunk in bytes when writing into ``fp``.
+
+        Returns
+        -------
+        bytes or int
+            The bytes of object, or the number of bytes written if ``fp`` is given.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
+    def iter_download(self, path, chunk_size=65536, auth_tuple=None, client=None):
+        """
+        Download an object from given path chunk by chunk, without buffering the whole object in memory.
+
+        Parameters
+        ----------
+        path : str
+            The absolute path of object such as ``/path/to/directory/object``
+        chunk_size : int
+            The size of each chunk in bytes.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+
+        Returns
+        -------
+        iterator
+            An iterator yields the bytes of object. For async version, the coroutine returns an async iterator,
+            so it should be awaited first, such as ``async for chunk in await dav.iter_download(path)``.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
+    def mget(self, paths, concurrency=8, auth_tuple=None, client=None):
+        """
+        Download several objects concurrently.
+
+        Parameters
+        ----------
+        paths : list
+            A list of absolute paths such as ``/path/to/directory/object``.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+
+        Returns
+        -------
+        :obj:`list`
+            A list contains the bytes of each object, in the same order as ``paths``.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
+    def mput(self, items, concurrency=8, auth_tuple=None, client=None):
+        """
+        Upload several objects concurrently.
+
+        Parameters
+        ----------
+        items : list
+            A list of tuples. Each tuple contains ``(content, path)`` as in :meth:`.upload`.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
 
         Returns
         -------
-        bytes
-            The bytes of object.
+        :obj:`list`
+            A list contains "Upload" or "Overwrite" for each item, in the same order as ``items``.
 
         Raises
         ------
@@ -307,6 +658,33 @@ class NutstoreDavBase:
         """
         raise NotImplementedError
 
+    def rm_many(self, paths, concurrency=8, auth_tuple=None, client=None):
+        """
+        Remove several files or directories concurrently.
+
+        Parameters
+        ----------
+        paths : list
+            A list of absolute paths such as ``/path/to/directory/object``.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+
+        Returns
+        -------
+        :obj:`list`
+            A list contains :obj:`True` for each path, in the same order as ``paths``.
+
+        Raises
+        ------
+        :exc:`.NSWebDavHTTPError`
+            Contains HTTP error code, exception and message.
+        """
+        raise NotImplementedError
+
     def share(self, path, users=None, groups=None, downloadable=True, auth_tuple=None, client=None):
         """
         Get the share link of given object.
@@ -811,6 +1189,41 @@ class NutstoreDavBase:
         """
         raise NotImplementedError
 
+    def create_team_members(self, users, concurrency=8, retries=3, auth_tuple=None, client=None):
+        """
+        Only for admin access token.
+
+        Create any number of new members for given team.
+
+        ``users`` are split into batches of 10, which are sent concurrently by :meth:`.create_team_member`.
+        A batch failed with a 5xx error is retried with exponential backoff.
+        A failed batch doesn't stop the others, the failures are raised together once all batches finished.
+
+        Parameters
+        ----------
+        users : :obj:`list`
+            A list contains all users, each user is a :obj:`dict` as in :meth:`.create_team_member`.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        retries : int
+            How many times each batch is tried before its error is raised, at least once.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+
+        Returns
+        -------
+        bool
+            Return :obj:`True` or raise exception.
+
+        Raises
+        ------
+        :exc:`.NSWebDavBatchError`
+            Contains each failed batch of users and its exception.
+        """
+        raise NotImplementedError
+
     def update_team_member_storage_quota(self, user_name, storage_quota, auth_tuple=None, client=None):
         """
         Only for admin access token.
@@ -1171,3 +1584,51 @@ class NutstoreDavBase:
             Contains HTTP error code, exception and message.
         """
         raise NotImplementedError
+
+    def query_audit_logs_range(self, time_start, time_end, user_name=None, op_type=None, file_name=None,
+                               slices=8, concurrency=4, retries=3, auth_tuple=None, client=None):
+        """
+        Only for admin access token.
+
+        Query audit logs of a long time range.
+
+        The range is split into ``slices`` equal, non-overlapping parts which are queried concurrently
+        by :meth:`.query_audit_logs`, then merged in time order.
+        A part failed with a 5xx error is retried with exponential backoff.
+        A failed part doesn't stop the others, the failures are raised together once all parts finished.
+
+        Parameters
+        ----------
+        time_start : float
+            The start time in Unix timestamp.
+        time_end : float
+            The end time in Unix timestamp.
+        user_name : str
+            The user name of a given user.
+        op_type : str
+            The operation type. Should be one of :obj:`.OPERATION_TYPE`.
+        file_name : str
+            The file name.
+        slices : int
+            How many parts the time range is split into.
+        concurrency : int
+            The maximum number of requests in flight at the same time.
+        retries : int
+            How many times each part is tried before its error is raised, at least once.
+        auth_tuple : tuple
+            The auth_tuple overriding global config.
+        client : :class:`aiohttp.ClientSession`
+            The client overriding global config.
+
+        Returns
+        -------
+        :class:`.Entity`
+            The same values as :meth:`.query_audit_logs`. ``log_num`` is the sum of all parts,
+            ``has_more`` is :obj:`True` if any part has more logs.
+
+        Raises
+        ------
+        :exc:`.NSWebDavBatchError`
+            Contains each failed ``(time_start, time_end)`` part and its exception.
+        """
+        raise NotImplementedError
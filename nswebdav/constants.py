@@ -1,14 +1,19 @@
-#: A dict contains permission's number as string and its corresponding meanings.
-PERM_MAP = {
-    "1": "download and preview",
-    "2": "upload",
-    "3": "upload, download, preview, remove and move",
-    "4": "upload, download, preview, remove, move and change acls of others",
-    "5": "preview"
-}
+from types import MappingProxyType
 
-#: A set contains all available operation types.
-OPERATION_TYPE = {
+#: A read-only dict contains permission's number as int and its corresponding meanings.
+PERM_MAP_INT = MappingProxyType({
+    1: "download and preview",
+    2: "upload",
+    3: "upload, download, preview, remove and move",
+    4: "upload, download, preview, remove, move and change acls of others",
+    5: "preview"
+})
+
+#: A read-only dict contains permission's number as string and its corresponding meanings.
+PERM_MAP = MappingProxyType({str(perm): meaning for perm, meaning in PERM_MAP_INT.items()})
+
+#: A frozenset contains all available operation types.
+OPERATION_TYPE = frozenset({
     "SESSION_START",
     "DOWNLOAD",
     "UPLOAD",
@@ -20,4 +25,4 @@ OPERATION_TYPE = {
     "PURGE",
     "PWD_ATTACK",
     "VIRUS_INFECTED"
-}
+})
@@ -1,6 +1,13 @@
+from io import BytesIO
+
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 
+# Whatever namespace the server binds the prefix to.
+_ERROR_FIELDS = ("{*}exception", "{*}message")
+# Error pages from proxies in front of the server.
+_HTML_HEADS = (b"<!doctype html", b"<html")
+
 
 class NSWebDavHTTPError(Exception):
     """
@@ -15,26 +22,56 @@ class NSWebDavHTTPError(Exception):
     message : str
         contains detail message which is extracted from server's xml response.
     """
+
     def __init__(self, code, content):
         exception, message = self._parse_response(content)
         self.code = code
         self.exception = exception
         self.message = message
+        self._str = "%s %s\nmessage: %s" % (code, exception or "Empty exception", message or "Empty message")
 
     def __str__(self):
-        return "%s %s\nmessage: %s" % (self.code, self.exception or "Empty exception", self.message or "Empty message")
+        return self._str
 
     def _parse_response(self, response):
+        if not response:
+            return None, None
+        # Only look at the head, stripping a large body would copy it. Some servers prepend a UTF-8 BOM.
+        head = bytes(response[:64]).lstrip(b"\xef\xbb\xbf").lstrip().lower()
+        if not head.startswith(b"<") or head.startswith(_HTML_HEADS):
+            return None, None
+        exception = message = None
+        # Stop as soon as both fields are read, the rest may be a long stack trace.
+        events = etree.iterparse(BytesIO(response), events=("end",), tag=_ERROR_FIELDS,
+                                 resolve_entities=False, no_network=True, huge_tree=False)
         try:
-            t = etree.fromstring(response)
+            for _, node in events:
+                if etree.QName(node).localname == "exception":
+                    exception = node.text
+                else:
+                    message = node.text
+                if exception is not None and message is not None:
+                    break
         except XMLSyntaxError:
-            return None, None
-        exception = t.find("s:exception", t.nsmap)
-        if exception is not None:
-            exception = exception.text
-        message = t.find("s:message", t.nsmap)
-        if message is not None:
-            message = message.text
+            pass
         return exception, message
 
     __repr__ = __str__
+
+
+class NSWebDavBatchError(Exception):
+    """
+    Raised when some parts of a batched operation failed, after all the other parts have finished.
+
+    Attributes
+    ----------
+    failures : :obj:`list`
+        A list of ``(part, exception)`` tuples, one for each failed part.
+    total : int
+        The number of parts in the operation.
+    """
+
+    def __init__(self, failures, total):
+        self.failures = failures
+        self.total = total
+        super().__init__("%d of %d parts failed, first error: %s" % (len(failures), total, failures[0][1]))
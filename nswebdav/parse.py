@@ -1,138 +1,196 @@
-from datetime import datetime
+from calendar import timegm
+from email.utils import mktime_tz, parsedate_tz
+from functools import lru_cache
+from io import BytesIO
+from threading import local
 
 from lxml import etree
 from urllib.parse import unquote
 
+_PARSER_OPTIONS = {"no_network": True, "resolve_entities": False, "huge_tree": False, "collect_ids": False,
+                   "remove_blank_text": True}
+_parsers = local()
+
+_LS_KEYS = ("href", "display_name", "is_dir", "content_length", "last_modified", "owner", "mime_type",
+            "readable", "writable", "full_privilege", "read_acl", "write_acl")
+_SEARCH_KEYS = ("href", "is_dir", "last_modified", "owner", "mime_type", "resource_perm", "content_length")
+
+_D_HREF = "{DAV:}href"
+_D_DISPLAYNAME = "{DAV:}displayname"
+_D_COLLECTION = "{DAV:}collection"
+_D_GETCONTENTLENGTH = "{DAV:}getcontentlength"
+_D_GETLASTMODIFIED = "{DAV:}getlastmodified"
+_D_OWNER = "{DAV:}owner"
+_D_GETCONTENTTYPE = "{DAV:}getcontenttype"
+_D_READ = "{DAV:}read"
+_D_WRITE = "{DAV:}write"
+_D_ALL = "{DAV:}all"
+_D_READ_ACL = "{DAV:}read_acl"
+_D_WRITE_ACL = "{DAV:}write_acl"
+
+_S_ACCOUNT_STATE = "{http://ns.jianguoyun.com}account_state"
+_S_ACL = "{http://ns.jianguoyun.com}acl"
+_S_ACTIVITY = "{http://ns.jianguoyun.com}activity"
+_S_ADMIN = "{http://ns.jianguoyun.com}admin"
+_S_COLLECTION = "{http://ns.jianguoyun.com}collection"
+_S_CONSUMING = "{http://ns.jianguoyun.com}consuming"
+_S_COPY_UUID = "{http://ns.jianguoyun.com}copy_uuid"
+_S_CURSOR = "{http://ns.jianguoyun.com}cursor"
+_S_DELTA = "{http://ns.jianguoyun.com}delta"
+_S_DISABLED = "{http://ns.jianguoyun.com}disabled"
+_S_ENTRY = "{http://ns.jianguoyun.com}entry"
+_S_EXPIRETIME = "{http://ns.jianguoyun.com}expireTime"
+_S_EXPIRE_TIME = "{http://ns.jianguoyun.com}expire_time"
+_S_FIRST_OPERATION_TIME = "{http://ns.jianguoyun.com}first_operation_time"
+_S_GROUP = "{http://ns.jianguoyun.com}group"
+_S_HASMORE = "{http://ns.jianguoyun.com}hasMore"
+_S_HAS_MORE = "{http://ns.jianguoyun.com}has_more"
+_S_HREF = "{http://ns.jianguoyun.com}href"
+_S_ID = "{http://ns.jianguoyun.com}id"
+_S_IP = "{http://ns.jianguoyun.com}ip"
+_S_IP_LOCATION = "{http://ns.jianguoyun.com}ip_location"
+_S_ISDELETED = "{http://ns.jianguoyun.com}isDeleted"
+_S_ISDIR = "{http://ns.jianguoyun.com}isDir"
+_S_LAST_OPERATION_TIME = "{http://ns.jianguoyun.com}last_operation_time"
+_S_LDAP_USER = "{http://ns.jianguoyun.com}ldap_user"
+_S_LOG_NUM = "{http://ns.jianguoyun.com}log_num"
+_S_MODIFIED = "{http://ns.jianguoyun.com}modified"
+_S_NAME = "{http://ns.jianguoyun.com}name"
+_S_NICKNAME = "{http://ns.jianguoyun.com}nickname"
+_S_OPERATION = "{http://ns.jianguoyun.com}operation"
+_S_OPERATOR = "{http://ns.jianguoyun.com}operator"
+_S_OWNER = "{http://ns.jianguoyun.com}owner"
+_S_PATH = "{http://ns.jianguoyun.com}path"
+_S_PERM = "{http://ns.jianguoyun.com}perm"
+_S_RESET = "{http://ns.jianguoyun.com}reset"
+_S_RESOURCEPERM = "{http://ns.jianguoyun.com}resourceperm"
+_S_REVISION = "{http://ns.jianguoyun.com}revision"
+_S_SANDBOX = "{http://ns.jianguoyun.com}sandbox"
+_S_SHARELINK = "{http://ns.jianguoyun.com}sharelink"
+_S_SIZE = "{http://ns.jianguoyun.com}size"
+_S_STORAGEQUOTA = "{http://ns.jianguoyun.com}storageQuota"
+_S_STORAGE_QUOTA = "{http://ns.jianguoyun.com}storage_quota"
+_S_SUBGROUP = "{http://ns.jianguoyun.com}subgroup"
+_S_TEAM_ID = "{http://ns.jianguoyun.com}team/{http://ns.jianguoyun.com}id"
+_S_TEAM_IS_ADMIN = "{http://ns.jianguoyun.com}team/{http://ns.jianguoyun.com}is_admin"
+_S_TERMINAL = "{http://ns.jianguoyun.com}terminal"
+_S_USED_STORAGE = "{http://ns.jianguoyun.com}used_storage"
+_S_USER = "{http://ns.jianguoyun.com}user"
+_S_USERNAME = "{http://ns.jianguoyun.com}username"
 
-def parse_ls(xml_content):
-    t = etree.fromstring(xml_content)
-
-    responses = t.findall(".//d:response", t.nsmap)
 
+def parse_ls(xml_content):
     results = []
-    for response in responses:
-        href = response.findtext(".//d:href", None, t.nsmap)
-        href = unquote(href) if href else None
-        display_name = response.findtext(".//d:displayname", None, t.nsmap)
-        is_dir = response.find(".//d:resourcetype/d:collection", t.nsmap) is not None
-        content_length = response.findtext(".//d:getcontentlength", None, t.nsmap)
+    for response in _iter_responses(xml_content):
+        fields = _descendants(response)
+        href = _field_text(fields, _D_HREF)
+        href = _fast_unquote(href) if href else None
+        display_name = _field_text(fields, _D_DISPLAYNAME)
+        is_dir = _D_COLLECTION in fields
+        content_length = _field_text(fields, _D_GETCONTENTLENGTH)
         content_length = int(content_length) if content_length else None
-        last_modified = response.findtext(".//d:getlastmodified", None, t.nsmap)
-        last_modified = datetime.strptime(
-            last_modified,
-            "%a, %d %b %Y %H:%M:%S %Z"
-        ).timestamp() if last_modified else None
-        owner = response.findtext(".//d:owner", None, t.nsmap)
-        mime_type = response.findtext(".//d:getcontenttype", None, t.nsmap)
-        readable = response.find(".//d:privilege/d:read", t.nsmap) is not None
-        writable = response.find(".//d:privilege/d:write", t.nsmap) is not None
-        full_privilege = response.find(".//d:privilege/d:all", t.nsmap) is not None
-        read_acl = response.find(".//d:privilege/d:read_acl", t.nsmap) is not None
-        write_acl = response.find(".//d:privilege/d:write_acl", t.nsmap) is not None
-
-        entity = Entity(href=href,
-                        display_name=display_name,
-                        is_dir=is_dir,
-                        content_length=content_length,
-                        last_modified=last_modified,
-                        owner=owner,
-                        mime_type=mime_type,
-                        readable=readable,
-                        writable=writable,
-                        full_privilege=full_privilege,
-                        read_acl=read_acl,
-                        write_acl=write_acl)
+        last_modified = _field_text(fields, _D_GETLASTMODIFIED)
+        last_modified = _parse_http_date(last_modified) if last_modified else None
+        owner = _field_text(fields, _D_OWNER)
+        mime_type = _field_text(fields, _D_GETCONTENTTYPE)
+        readable = _D_READ in fields
+        writable = _D_WRITE in fields
+        full_privilege = _D_ALL in fields
+        read_acl = _D_READ_ACL in fields
+        write_acl = _D_WRITE_ACL in fields
+
+        entity = Entity.from_values(_LS_KEYS, (href, display_name, is_dir, content_length, last_modified, owner,
+                                               mime_type, readable, writable, full_privilege, read_acl, write_acl))
         results.append(entity)
     return results
 
 
 def parse_search(xml_content):
-    t = etree.fromstring(xml_content)
-
-    responses = t.findall(".//d:response", t.nsmap)
-
     results = []
-    for response in responses:
-        href = response.findtext(".//d:href", None, t.nsmap)
-        href = unquote(href) if href else None
-        is_dir = response.find(".//d:resourcetype/d:collection", t.nsmap) is not None
-        last_modified = response.findtext(".//d:getlastmodified", None, t.nsmap)
-        last_modified = datetime.strptime(
-            last_modified,
-            "%a, %d %b %Y %H:%M:%S %Z"
-        ).timestamp() if last_modified else None
-        content_length = response.findtext(".//d:getcontentlength", None, t.nsmap)
+    for response in _iter_responses(xml_content):
+        fields = _descendants(response)
+        href = _field_text(fields, _D_HREF)
+        href = _fast_unquote(href) if href else None
+        is_dir = _D_COLLECTION in fields
+        last_modified = _field_text(fields, _D_GETLASTMODIFIED)
+        last_modified = _parse_http_date(last_modified) if last_modified else None
+        content_length = _field_text(fields, _D_GETCONTENTLENGTH)
         content_length = int(content_length) if content_length else None
-        resource_perm = response.findtext(".//s:resourceperm", None, t.nsmap)
-        owner = response.findtext(".//d:owner", None, t.nsmap)
-        mime_type = response.findtext(".//d:getcontenttype", None, t.nsmap)
+        resource_perm = _field_text(fields, _S_RESOURCEPERM)
+        owner = _field_text(fields, _D_OWNER)
+        mime_type = _field_text(fields, _D_GETCONTENTTYPE)
 
-        entity = Entity(href=href,
-                        is_dir=is_dir,
-                        last_modified=last_modified,
-                        owner=owner,
-                        mime_type=mime_type,
-                        resource_perm=resource_perm,
-                        content_length=content_length)
+        entity = Entity.from_values(_SEARCH_KEYS, (href, is_dir, last_modified, owner, mime_type, resource_perm,
+                                                   content_length))
         results.append(entity)
     return results
 
 
 def parse_share_link(xml_content):
-    t = etree.fromstring(xml_content)
-    share_link = t.findtext("s:sharelink", "", t.nsmap).strip()
+    t = etree.fromstring(xml_content, _parser())
+    share_link = t.findtext(_S_SHARELINK, "").strip()
     return share_link
 
 
 def parse_acl(xml_content):
-    t = etree.fromstring(xml_content)
+    t = etree.fromstring(xml_content, _parser())
     results = Entity({
         "users": Entity(),
         "groups": Entity()
     })
-    acls = t.findall("s:acl", t.nsmap)
-    for acl in acls:
-        user = acl.findtext("s:username", None, t.nsmap)
-        perm = acl.findtext("s:perm", "", t.nsmap)
+    for acl in t.iterchildren(_S_ACL):
+        # One pass over the children, keeping the first of each tag like ``findtext`` does.
+        user = perm = group = None
+        for child in acl.iterchildren(_S_USERNAME, _S_PERM, _S_GROUP):
+            tag = child.tag
+            if tag == _S_USERNAME:
+                if user is None:
+                    user = child.text or ""
+            elif tag == _S_PERM:
+                if perm is None:
+                    perm = child.text or ""
+            elif group is None:
+                group = child.text or ""
+        if perm is None:
+            perm = ""
         if user is not None:
             results.users[user] = perm
         else:
-            group = acl.findtext("s:group", "", t.nsmap)
-            results.groups[group] = perm
+            results.groups[group or ""] = perm
     return results
 
 
 def parse_latest_cursor(xml_content):
-    t = etree.fromstring(xml_content)
-    cursor = t.findtext("s:cursor", None, t.nsmap)
+    t = etree.fromstring(xml_content, _parser())
+    cursor = t.findtext(_S_CURSOR, None)
     return int(cursor, 16) if cursor is not None else None
 
 
 def parse_cp_shared_object(xml_content):
-    t = etree.fromstring(xml_content)
-    return t.findtext("s:copy_uuid", "", t.nsmap)
+    t = etree.fromstring(xml_content, _parser())
+    return t.findtext(_S_COPY_UUID, "")
 
 
 def parse_content_url(xml_content):
-    t = etree.fromstring(xml_content)
-    href = unquote(t.findtext("s:href", "", t.nsmap))
+    t = etree.fromstring(xml_content, _parser())
+    href = _fast_unquote(t.findtext(_S_HREF, ""))
     return href
 
 
 def parse_team_members(xml_content):
-    t = etree.fromstring(xml_content)
+    t = etree.fromstring(xml_content, _parser())
 
     results = []
-    for member in t.getchildren():
-        is_admin = bool("admin" in member.tag)
-        user_name = member.findtext("s:username", None, t.nsmap)
-        nickname = member.findtext("s:nickname", None, t.nsmap)
-        storage_quota = member.findtext("s:storage_quota", None, t.nsmap)
+    for member in t.iterchildren(tag=etree.Element):
+        is_admin = member.tag.endswith("}admin")
+        user_name = member.findtext(_S_USERNAME, None)
+        nickname = member.findtext(_S_NICKNAME, None)
+        storage_quota = member.findtext(_S_STORAGE_QUOTA, None)
         storage_quota = int(storage_quota) if storage_quota else None
-        ldap_user = member.findtext("s:ldap_user", None, t.nsmap)
-        ldap_user = ldap_user == "true" if ldap_user else None
-        disabled = member.findtext("s:disabled", None, t.nsmap)
-        disabled = disabled == "true" if disabled else None
+        ldap_user = member.findtext(_S_LDAP_USER, None)
+        ldap_user = _bool(ldap_user)
+        disabled = member.findtext(_S_DISABLED, None)
+        disabled = _bool(disabled)
         entity = Entity(admin=is_admin,
                         user_name=user_name,
                         nickname=nickname,
@@ -144,35 +202,24 @@ def parse_team_members(xml_content):
 
 
 def parse_history(xml_content):
-    t = etree.fromstring(xml_content)
-
-    reset = t.findtext("s:reset", None, t.nsmap)
-    reset = reset == "true" if reset else None
-    cursor = t.findtext("s:cursor", None, t.nsmap)
-    cursor = int(cursor, 16) if cursor else None
-    has_more = t.findtext("s:hasMore", None, t.nsmap)
-    has_more = has_more == "true" if has_more else None
-
-    history = Entity(reset=reset,
-                     cursor=cursor,
-                     has_more=has_more,
-                     deltas=[])
-
-    entries = t.findall("s:delta/s:entry", t.nsmap)
-    for entry in entries:
-        path = entry.findtext(".//s:path", None, t.nsmap)
-        size = entry.findtext(".//s:size", None, t.nsmap)
+    deltas = []
+    context = _iterparse(xml_content, _S_ENTRY)
+    for entry in _pruned(context):
+        # Only ``delta/entry`` right under the root holds a delta.
+        parent = entry.getparent()
+        if parent.tag != _S_DELTA or parent.getparent() is None or parent.getparent().getparent() is not None:
+            continue
+        fields = _descendants(entry)
+        path = _field_text(fields, _S_PATH)
+        size = _field_text(fields, _S_SIZE)
         size = int(size) if size else None
-        is_deleted = entry.findtext(".//s:isDeleted", None, t.nsmap)
-        is_deleted = is_deleted == "true" if is_deleted else None
-        is_dir = entry.findtext(".//s:isDir", None, t.nsmap)
-        is_dir = is_dir == "true" if is_dir else None
-        modified = entry.findtext(".//s:modified", None, t.nsmap)
-        modified = datetime.strptime(
-            modified,
-            "%a, %d %b %Y %H:%M:%S %Z"
-        ).timestamp() if modified else None
-        revision = entry.findtext(".//s:revision", None, t.nsmap)
+        is_deleted = _field_text(fields, _S_ISDELETED)
+        is_deleted = _bool(is_deleted)
+        is_dir = _field_text(fields, _S_ISDIR)
+        is_dir = _bool(is_dir)
+        modified = _field_text(fields, _S_MODIFIED)
+        modified = _parse_http_date(modified) if modified else None
+        revision = _field_text(fields, _S_REVISION)
         revision = int(revision) if revision else None
         entity = Entity(path=path,
                         size=size,
@@ -180,33 +227,48 @@ def parse_history(xml_content):
                         is_dir=is_dir,
                         modified=modified,
                         revision=revision)
-        history.deltas.append(entity)
+        deltas.append(entity)
+
+    # Entries are gone by now, the root only keeps the small header fields.
+    t = context.root
+    reset = t.findtext(_S_RESET)
+    reset = _bool(reset)
+    cursor = t.findtext(_S_CURSOR)
+    cursor = int(cursor, 16) if cursor else None
+    has_more = t.findtext(_S_HASMORE)
+    has_more = _bool(has_more)
+
+    history = Entity(reset=reset,
+                     cursor=cursor,
+                     has_more=has_more,
+                     deltas=deltas)
     return history
 
 
 def parse_user_info(xml_content):
-    t = etree.fromstring(xml_content)
-    user_name = t.findtext("s:username", None, t.nsmap)
-    state = t.findtext("s:account_state", None, t.nsmap)
-    storage_quota = t.findtext("s:storage_quota", None, t.nsmap)
+    t = etree.fromstring(xml_content, _parser())
+    user_name = t.findtext(_S_USERNAME, None)
+    state = t.findtext(_S_ACCOUNT_STATE, None)
+    storage_quota = t.findtext(_S_STORAGE_QUOTA, None)
     storage_quota = int(storage_quota) if storage_quota else None
-    used_storage = t.findtext("s:used_storage", None, t.nsmap)
+    used_storage = t.findtext(_S_USED_STORAGE, None)
     used_storage = int(used_storage) if used_storage else None
-    is_admin = t.findtext("s:team/s:is_admin", None, t.nsmap)
-    is_admin = is_admin.text == "true" if is_admin else None
-    team_id = t.findtext("s:team/s:id", None, t.nsmap)
-    expire_time = t.findtext("s:expire_time", None, t.nsmap)
+    is_admin = t.findtext(_S_TEAM_IS_ADMIN, None)
+    is_admin = _bool(is_admin)
+    team_id = t.findtext(_S_TEAM_ID, None)
+    expire_time = t.findtext(_S_EXPIRE_TIME, None)
     expire_time = int(expire_time) / 1000 if expire_time else None  # convert to timestamp
 
-    _collections = t.findall("s:collection", t.nsmap)
+    _collections = t.findall(_S_COLLECTION)
     collections = []
     for _collection in _collections:
-        href = _collection.findtext(".//s:href", None, t.nsmap)
-        href = unquote(href) if href else None
-        used_storage = _collection.findtext(".//s:used_storage", None, t.nsmap)
+        fields = _descendants(_collection)
+        href = _field_text(fields, _S_HREF)
+        href = _fast_unquote(href) if href else None
+        used_storage = _field_text(fields, _S_USED_STORAGE)
         used_storage = int(used_storage) if used_storage else None
-        is_owner = _collection.findtext(".//s:owner", None, t.nsmap)
-        is_owner = is_owner == "true" if is_owner else None
+        is_owner = _field_text(fields, _S_OWNER)
+        is_owner = _bool(is_owner)
         collection = Entity(href=href,
                             used_storage=used_storage,
                             is_owner=is_owner)
@@ -223,18 +285,18 @@ def parse_user_info(xml_content):
 
 
 def parse_team_member_info(xml_content):
-    t = etree.fromstring(xml_content)
-    user_name = t.findtext("s:username", None, t.nsmap)
-    storage_quota = t.findtext("s:storageQuota", None, t.nsmap)
+    t = etree.fromstring(xml_content, _parser())
+    user_name = t.findtext(_S_USERNAME, None)
+    storage_quota = t.findtext(_S_STORAGEQUOTA, None)
     storage_quota = int(storage_quota) if storage_quota else None
-    expire_time = t.findtext("s:expireTime", None, t.nsmap)
+    expire_time = t.findtext(_S_EXPIRETIME, None)
     expire_time = int(expire_time) / 1000 if expire_time else None  # convert to timestamp
 
-    _sandboxes = t.findall("s:sandbox", t.nsmap)
+    _sandboxes = t.findall(_S_SANDBOX)
     sandboxes = []
     for _sandbox in _sandboxes:
-        name = _sandbox.findtext("s:name", None, t.nsmap)
-        storage_quota = _sandbox.findtext("s:storageQuota", None, t.nsmap)
+        name = _sandbox.findtext(_S_NAME, None)
+        storage_quota = _sandbox.findtext(_S_STORAGEQUOTA, None)
         sandbox = Entity(name=name,
                          storage_quota=storage_quota)
         sandboxes.append(sandbox)
@@ -246,32 +308,32 @@ def parse_team_member_info(xml_content):
 
 
 def parse_group_members(xml_content):
-    t = etree.fromstring(xml_content)
+    t = etree.fromstring(xml_content, _parser())
 
-    _subgroups = t.findall("s:subgroup", t.nsmap)
+    _subgroups = t.findall(_S_SUBGROUP)
     subgroups = []
     for _subgroup in _subgroups:
-        group_id = _subgroup.findtext("s:id", None, t.nsmap)
+        group_id = _subgroup.findtext(_S_ID, None)
         group_id = int(group_id) if group_id else None
-        name = _subgroup.findtext("s:name", None, t.nsmap)
+        name = _subgroup.findtext(_S_NAME, None)
         subgroup = Entity(group_id=group_id,
                           name=name)
         subgroups.append(subgroup)
 
-    _admins = t.findall("s:admin", t.nsmap)
+    _admins = t.findall(_S_ADMIN)
     admins = []
     for _admin in _admins:
-        user_name = _admin.findtext("s:username", None, t.nsmap)
-        nickname = _admin.findtext("s:nickname", None, t.nsmap)
+        user_name = _admin.findtext(_S_USERNAME, None)
+        nickname = _admin.findtext(_S_NICKNAME, None)
         admin = Entity(user_name=user_name,
                        nickname=nickname)
         admins.append(admin)
 
-    _users = t.findall("s:user", t.nsmap)
+    _users = t.findall(_S_USER)
     users = []
     for _user in _users:
-        user_name = _user.findtext("s:username", None, t.nsmap)
-        nickname = _user.findtext("s:nickname", None, t.nsmap)
+        user_name = _user.findtext(_S_USERNAME, None)
+        nickname = _user.findtext(_S_NICKNAME, None)
         user = Entity(user_name=user_name,
                       nickname=nickname)
         users.append(user)
@@ -283,34 +345,34 @@ def parse_group_members(xml_content):
 
 
 def parse_created_group(xml_content):
-    t = etree.fromstring(xml_content)
+    t = etree.fromstring(xml_content, _parser())
 
-    group_id = t.findtext("s:id", None, t.nsmap)
+    group_id = t.findtext(_S_ID, None)
     group_id = int(group_id) if group_id else None
     return group_id
 
 
 def parse_audit_logs(xml_content):
-    t = etree.fromstring(xml_content)
+    t = etree.fromstring(xml_content, _parser())
 
-    log_num = t.findtext("s:log_num", None, t.nsmap)
+    log_num = t.findtext(_S_LOG_NUM, None)
     log_num = int(log_num) if log_num else None
-    first_operation_time = t.findtext("s:first_operation_time", None, t.nsmap)
+    first_operation_time = t.findtext(_S_FIRST_OPERATION_TIME, None)
     first_operation_time = int(first_operation_time) / 1000 if first_operation_time else None  # convert to timestamp
-    last_operation_time = t.findtext("s:last_operation_time", None, t.nsmap)
+    last_operation_time = t.findtext(_S_LAST_OPERATION_TIME, None)
     last_operation_time = int(last_operation_time) / 1000 if last_operation_time else None  # convert to timestamp
-    has_more = t.findtext("s:has_more", None, t.nsmap)
-    has_more = has_more == "true" if has_more else None
+    has_more = t.findtext(_S_HAS_MORE, None)
+    has_more = _bool(has_more)
 
-    _activities = t.findall("s:activity", t.nsmap)
+    _activities = t.findall(_S_ACTIVITY)
     activities = []
     for _activity in _activities:
-        operator = _activity.findtext("s:operator", None, t.nsmap)
-        operation = _activity.findtext("s:operation", None, t.nsmap)
-        ip = _activity.findtext("s:ip", None, t.nsmap)
-        ip_location = _activity.findtext("s:ip_location", None, t.nsmap)
-        terminal = _activity.findtext("s:terminal", None, t.nsmap)
-        consuming = _activity.findtext("s:consuming", None, t.nsmap)
+        operator = _activity.findtext(_S_OPERATOR, None)
+        operation = _activity.findtext(_S_OPERATION, None)
+        ip = _activity.findtext(_S_IP, None)
+        ip_location = _activity.findtext(_S_IP_LOCATION, None)
+        terminal = _activity.findtext(_S_TERMINAL, None)
+        consuming = _activity.findtext(_S_CONSUMING, None)
 
         activity = Entity(operator=operator,
                           operation=operation,
@@ -328,19 +390,106 @@ def parse_audit_logs(xml_content):
     return entity
 
 
+_MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+           "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+
+# Entries of one listing often share the same date, and values are plain ``str`` from ``.text``.
+@lru_cache(maxsize=4096)
+def _parse_http_date(value):
+    # Fast path for RFC 1123 dates such as "Sun, 06 Nov 1994 08:49:37 GMT", which are always in UTC.
+    try:
+        _, day, month, year, clock, zone = value.split(" ")
+        if zone == "GMT":
+            hour, minute, second = clock.split(":")
+            return float(timegm((int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second), 0, 0, 0)))
+    except (ValueError, KeyError):
+        pass
+    # Anything else, numeric offsets included, goes through the full parser which honours the zone.
+    return float(mktime_tz(parsedate_tz(value)))
+
+
+def _iterparse(xml_content, tag):
+    # A file object (such as a streamed response body) is read incrementally instead of being buffered first.
+    source = xml_content if hasattr(xml_content, "read") else BytesIO(xml_content)
+    return etree.iterparse(source, tag=tag, **_PARSER_OPTIONS)
+
+
+def _pruned(context):
+    # Drop each element once handled, so memory stays bounded by one element.
+    for _, element in context:
+        yield element
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _iter_responses(xml_content):
+    return _pruned(_iterparse(xml_content, "{DAV:}response"))
+
+
+def _parser():
+    # A parser can't be used by two threads at once, so keep one per thread.
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = _parsers.parser = etree.XMLParser(**_PARSER_OPTIONS)
+    return parser
+
+
+def _bool(value):
+    # Missing or empty values stay None, like the other optional fields.
+    return value == "true" if value else None
+
+
+def _fast_unquote(value):
+    # Most hrefs have nothing to decode.
+    return unquote(value) if "%" in value else value
+
+
+def _descendants(node):
+    # One walk over the subtree, keeping the first element of each tag like ``find`` does.
+    fields = {}
+    for child in node.iterdescendants():
+        if child.tag not in fields:
+            fields[child.tag] = child
+    return fields
+
+
+def _field_text(fields, tag):
+    # Same semantics as ``findtext``: None if missing, "" if the element has no text.
+    node = fields.get(tag)
+    return (node.text or "") if node is not None else None
+
+
+_MISSING = object()
+
+
 class Entity(dict):
     """
     It works like a normal dict but values can be accessed as attribute.
     """
+    # Attributes are stored as keys, so instances don't need a __dict__ of their own.
+    __slots__ = ()
 
     def __getattr__(self, name):
-        try:
-            return self[name]
-        except KeyError:
+        value = self.get(name, _MISSING)
+        if value is _MISSING:
             raise AttributeError("No such key '%s'" % name)
+        return value
 
     __setattr__ = dict.__setitem__
 
+    @classmethod
+    def from_values(cls, keys, values):
+        """
+        Build an entity from a tuple of keys and a tuple of values in the same order.
+
+        It skips keyword arguments packing, which matters when building a lot of entities.
+        """
+        obj = dict.__new__(cls)
+        dict.__init__(obj, zip(keys, values))
+        return obj
+
     def __delattr__(self, name):
         try:
             del self[name]
@@ -1,91 +1,98 @@
-from jinja2 import Template
+from jinja2 import Environment
 
 from nswebdav.constants import OPERATION_TYPE
 
+_XML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\"": "&quot;"})
+
+
+def _escape(value):
+    return str(value).translate(_XML_ESCAPE)
+
+
+# One environment for every template; trimming block lines keeps the rendered bodies free of blank lines.
+# Values are escaped by the renderers, so autoescape stays off.
+_ENV = Environment(trim_blocks=True, lstrip_blocks=True, auto_reload=False, autoescape=False)
+
+
+def render_propfind(props):
+    parts = ['<?xml version="1.0" encoding="utf-8"?>', '<d:propfind xmlns:d="DAV:">', "<d:prop>"]
+    parts.extend("<d:%s/>" % prop for prop in props)
+    parts.append("</d:prop>")
+    parts.append("</d:propfind>")
+    return "".join(parts).encode("utf-8")
+
 
 def render_pubObject(path, users, groups, downloadable):
     users = users or []
     groups = groups or []
-    downloadable = str(downloadable).lower()
-    template = Template("""
-        <?xml version="1.0" encoding="utf-8"?>
-        <s:publish xmlns:s="http://ns.jianguoyun.com">
-            <s:href>{{ path }}</s:href>
-            {% if users or groups %}
-            <s:acl>
-            {% for user in users %}
-                <s:username>{{ user }}</s:username>
-            {% endfor %}
-            {% for group in groups %}
-                <s:group>{{ group }}</s:group>
-            {% endfor %}
-            </s:acl>
-            {% endif %}
-            <s:downloadDisabled>{{ downloadable }}</s:downloadDisabled>
-        </s:publish>
-    """.strip())
-    return template.render(**locals())
+    download_disabled = "false" if downloadable else "true"
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:publish xmlns:s="http://ns.jianguoyun.com">',
+        "<s:href>%s</s:href>" % _escape(path),
+    ]
+    if users or groups:
+        parts.append("<s:acl>")
+        parts.extend("<s:username>%s</s:username>" % _escape(user) for user in users)
+        parts.extend("<s:group>%s</s:group>" % _escape(group) for group in groups)
+        parts.append("</s:acl>")
+    parts.append("<s:downloadDisabled>%s</s:downloadDisabled>" % download_disabled)
+    parts.append("</s:publish>")
+    return "".join(parts).encode("utf-8")
+
+
+_GET_SANDBOX_ACL = ('<?xml version="1.0" encoding="utf-8"?>'
+                    '<s:get_acl xmlns:s="http://ns.jianguoyun.com">'
+                    '<s:href>{path}</s:href>'
+                    '</s:get_acl>')
 
 
 def render_getSandboxAcl(path):
-    template = Template("""
-    <?xml version="1.0" encoding="utf-8"?>
-    <s:get_acl xmlns:s="http://ns.jianguoyun.com">
-        <s:href>{{ path }}</s:href>
-    </s:get_acl>
-    """.strip())
-    return template.render(**locals())
+    return _GET_SANDBOX_ACL.format(path=_escape(path)).encode("utf-8")
 
 
 def render_updateSandboxAcl(path, users, groups):
     users = users or []
     groups = groups or []
-    template = Template("""
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:sandbox xmlns:s="http://ns.jianguoyun.com">',
+        "<s:href>%s</s:href>" % _escape(path),
+    ]
+    parts.extend("<s:acl><s:username>%s</s:username><s:perm>%s</s:perm></s:acl>" % (_escape(user), perm)
+                 for user, perm in users)
+    parts.extend("<s:acl><s:group>%s</s:group><s:perm>%s</s:perm></s:acl>" % (_escape(group), perm)
+                 for group, perm in groups)
+    parts.append("</s:sandbox>")
+    return "".join(parts).encode("utf-8")
+
+
+_TPL_DELTA = _ENV.from_string("""
             <?xml version="1.0" encoding="utf-8"?>
-            <s:sandbox xmlns:s="http://ns.jianguoyun.com">
-                <s:href>{{ path }}</s:href>
-                {% for user in users %}
-                <s:acl>
-                    <s:username>{{ user[0] }}</s:username>
-                    <s:perm>{{ user[1] }}</s:perm>
-                </s:acl>
-                {% endfor %}
-                {% for group in groups %}
-                <s:acl>
-                    <s:group>{{ group }}</s:group>
-                    <s:perm>{{ group[1] }}</s:perm>
-                </s:acl>
-                {% endfor %}
-            </s:sandbox>
+            <s:delta xmlns:s="http://ns.jianguoyun.com">
+                <s:folderName>{{ folder }}</s:folderName>
+                {% if cursor %}<s:cursor>{{ cursor }}</s:cursor>{% endif %}
+            </s:delta>
         """.strip())
-    return template.render(**locals())
 
 
 def render_delta(folder, cursor):
     if cursor:
         cursor = "%X" % cursor
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:delta xmlns:s="http://ns.jianguoyun.com">
-                <s:folderName>{{ folder }}</s:folderName>
-                {% if cursor %}<s:cursor>{{ cursor }}</s:cursor>{% endif %}
-            </s:delta>
-        """.strip())
-    return template.render(**locals())
+    return _TPL_DELTA.render(folder=_escape(folder), cursor=cursor).encode("utf-8")
+
+
+_LATEST_DELTA_CURSOR = ('<?xml version="1.0" encoding="utf-8"?>'
+                        '<s:delta xmlns:s="http://ns.jianguoyun.com">'
+                        '<s:folderName>{folder}</s:folderName>'
+                        '</s:delta>')
 
 
 def render_latestDeltaCursor(folder):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:delta xmlns:s="http://ns.jianguoyun.com">
-                <s:folderName>{{ folder }}</s:folderName>
-            </s:delta>
-        """.strip())
-    return template.render(**locals())
+    return _LATEST_DELTA_CURSOR.format(folder=_escape(folder)).encode("utf-8")
 
 
-def render_submitCopyPubObject(path, url, password):
-    template = Template("""
+_TPL_SUBMIT_COPY_PUB_OBJECT = _ENV.from_string("""
             <?xml version="1.0" encoding="utf-8"?>
             <s:copy_pub xmlns:s="http://ns.jianguoyun.com">
                 <s:href>{{ path }}</s:href>
@@ -93,45 +100,49 @@ def render_submitCopyPubObject(path, url, password):
                 {% if password %}<s:copy_password>{{ password }}</s:copy_password>{% endif %}
             </s:copy_pub>
         """.strip())
-    return template.render(**locals())
+
+
+def render_submitCopyPubObject(path, url, password):
+    return _TPL_SUBMIT_COPY_PUB_OBJECT.render(path=_escape(path), url=_escape(url),
+                                              password=password and _escape(password)).encode("utf-8")
+
+
+_POLL_COPY_PUB_OBJECT = ('<?xml version="1.0" encoding="utf-8"?>'
+                         '<s:copy_pub xmlns:s="http://ns.jianguoyun.com">'
+                         '<s:copy_uuid>{copy_uuid}</s:copy_uuid>'
+                         '</s:copy_pub>')
 
 
 def render_pollCopyPubObject(copy_uuid):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:copy_pub xmlns:s="http://ns.jianguoyun.com">
-                <s:copy_uuid>{{ copy_uuid }}</s:copy_uuid>
-            </s:copy_pub>
-        """.strip())
-    return template.render(**locals())
+    return _POLL_COPY_PUB_OBJECT.format(copy_uuid=_escape(copy_uuid)).encode("utf-8")
+
+
+_SEARCH = ('<?xml version="1.0" encoding="utf-8"?>'
+           '<s:search xmlns:s="http://ns.jianguoyun.com">'
+           '<s:keywords>{keywords}</s:keywords>'
+           '<s:path>{path}</s:path>'
+           '</s:search>')
 
 
 def render_search(keywords, path):
     keywords = " ".join(keywords)
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:search xmlns:s="http://ns.jianguoyun.com">
-                <s:keywords>{{ keywords }}</s:keywords>
-                <s:path>{{ path }}</s:path>
-            </s:search>
-        """.strip())
-    return template.render(**locals())
+    return _SEARCH.format(keywords=_escape(keywords), path=_escape(path)).encode("utf-8")
+
+
+_DIRECT_CONTENT_URL = ('<?xml version="1.0" encoding="utf-8"?>'
+                       '<s:direct_content_link xmlns:s="http://ns.jianguoyun.com">'
+                       '<s:href>{path}</s:href>'
+                       '<s:platform>{platform}</s:platform>'
+                       '<s:link_type>{link_type}</s:link_type>'
+                       '</s:direct_content_link>')
 
 
 def render_directContentUrl(path, platform, link_type):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:direct_content_link xmlns:s="http://ns.jianguoyun.com">
-                <s:href>{{ path }}</s:href>
-                <s:platform>{{ platform }}</s:platform>
-                <s:link_type>{{ link_type }}</s:link_type>
-            </s:direct_content_link>
-        """.strip())
-    return template.render(**locals())
+    return _DIRECT_CONTENT_URL.format(path=_escape(path), platform=_escape(platform),
+                                      link_type=_escape(link_type)).encode("utf-8")
 
 
-def render_directPubContentUrl(link, platform, link_type, relative_path, password):
-    template = Template("""
+_TPL_DIRECT_PUB_CONTENT_URL = _ENV.from_string("""
             <?xml version="1.0" encoding="utf-8"?>
             <s:direct_content_link xmlns:s="http://ns.jianguoyun.com">
                 <s:href>{{ link }}</s:href>
@@ -141,17 +152,27 @@ def render_directPubContentUrl(link, platform, link_type, relative_path, passwor
                 {% if password %}<s:password>{{ password }}</s:password>{% endif %}
             </s:direct_content_link>
         """.strip())
-    return template.render(**locals())
+
+
+def render_directPubContentUrl(link, platform, link_type, relative_path, password):
+    return _TPL_DIRECT_PUB_CONTENT_URL.render(link=_escape(link), platform=_escape(platform),
+                                              link_type=_escape(link_type),
+                                              relative_path=relative_path and _escape(relative_path),
+                                              password=password and _escape(password)).encode("utf-8")
+
+
+_UPDATE_TEAM_INFO = ('<?xml version="1.0" encoding="utf-8"?>'
+                     '<s:team xmlns:s="http://ns.jianguoyun.com">'
+                     '<s:name>{name}</s:name>'
+                     '</s:team>')
 
 
 def render_updateTeamInfo(name):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:team xmlns:s="http://ns.jianguoyun.com">
-                <s:name>{{ name }}</s:name>
-            </s:team>
-        """.strip())
-    return template.render(**locals())
+    return _UPDATE_TEAM_INFO.format(name=_escape(name)).encode("utf-8")
+
+
+_REQUIRED_MEMBER_KEYS = ("user_name", "password", "storage_quota")
+_OPTIONAL_MEMBER_KEYS = ("nickname", "ldap_user", "ldap_id")
 
 
 def render_createEtpTeamMember(users):
@@ -160,67 +181,55 @@ def render_createEtpTeamMember(users):
         raise ValueError("Empty users")
     if length > 10:
         raise ValueError("Too many users at once.")
+    members = []
     for user in users:
-        try:
-            _ = user["user_name"]
-            _ = user["password"]
-            _ = user["storage_quota"]
-        except KeyError as e:
-            missing_key = e.args[0]
-            raise KeyError("Missing %s" % missing_key)
-        if "ldap_user" in user:
-            user["ldap_user"] = str(user["ldap_user"]).lower()
-
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:team xmlns:s="http://ns.jianguoyun.com">
-                {% for user in users %}
-                <s:user>
-                    <s:username>{{ user["user_name"] }}</s:username>
-                    <s:password>{{ user["password"] }}</s:password>
-                    <s:storage_quota>{{ user["storage_quota"] }}</s:storage_quota>
-                    {% if "nickname" in user %}
-                        <s:nickname>{{ user["nickname"] }}</s:nickname>
-                    {% endif %}
-                    {% if "ldap_user" in user %}
-                        <s:ldap_user>{{ user["ldap_user"] }}</s:ldap_user>
-                    {% endif %}
-                    {% if "ldap_id" in user %}
-                        <s:ldap_id>{{ user["ldap_id"] }}</s:ldap_id>
-                    {% endif %}
-                </s:user>
-                {% endfor %}
-            </s:team>
-    """.strip())
-    return template.render(**locals())
+        for key in _REQUIRED_MEMBER_KEYS:
+            if key not in user:
+                raise KeyError("Missing %s" % key)
+        # Work on a copy so the caller's dicts are left untouched.
+        member = {key: value if key == "storage_quota" else _escape(value) for key, value in user.items()}
+        if "ldap_user" in member:
+            member["ldap_user"] = member["ldap_user"].lower()
+        members.append(member)
+
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:team xmlns:s="http://ns.jianguoyun.com">',
+    ]
+    for member in members:
+        parts.append("<s:user><s:username>%s</s:username><s:password>%s</s:password>"
+                     "<s:storage_quota>%s</s:storage_quota>"
+                     % (member["user_name"], member["password"], member["storage_quota"]))
+        parts.extend("<s:%s>%s</s:%s>" % (key, member[key], key)
+                     for key in _OPTIONAL_MEMBER_KEYS if key in member)
+        parts.append("</s:user>")
+    parts.append("</s:team>")
+    return "".join(parts).encode("utf-8")
+
+
+_UPDATE_TEAM_MEMBER_STORAGE_QUOTA = ('<?xml version="1.0" encoding="utf-8"?>'
+                                     '<s:team xmlns:s="http://ns.jianguoyun.com">'
+                                     '<s:username>{user_name}</s:username>'
+                                     '<s:storageQuota>{storage_quota}</s:storageQuota>'
+                                     '</s:team>')
 
 
 def render_updateTeamMemberStorageQuota(user_name, storage_quota):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:team xmlns:s="http://ns.jianguoyun.com">
-                <s:username>{{ user_name }}</s:username>
-                <s:storageQuota>{{ storage_quota }}</s:storageQuota>
-            </s:team>
-    """.strip())
-    return template.render(**locals())
+    return _UPDATE_TEAM_MEMBER_STORAGE_QUOTA.format(user_name=_escape(user_name),
+                                                   storage_quota=storage_quota).encode("utf-8")
+
+
+_GET_TEAM_MEMBER_INFO = ('<?xml version="1.0" encoding="utf-8"?>'
+                         '<s:team xmlns:s="http://ns.jianguoyun.com">'
+                         '<s:username>{user_name}</s:username>'
+                         '</s:team>')
 
 
 def render_getTeamMemberInfo(user_name):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:team xmlns:s="http://ns.jianguoyun.com">
-                <s:username>{{ user_name }}</s:username>
-            </s:team>
-    """.strip())
-    return template.render(**locals())
+    return _GET_TEAM_MEMBER_INFO.format(user_name=_escape(user_name)).encode("utf-8")
 
 
-def render_removeTeamMember(user_name, folder_receipt, clean_perms):
-    if clean_perms:
-        folder_receipt = None
-    clean_perms = str(clean_perms).lower()
-    template = Template("""
+_TPL_REMOVE_TEAM_MEMBER = _ENV.from_string("""
             <?xml version="1.0" encoding="utf-8"?>
             <s:team xmlns:s="http://ns.jianguoyun.com">
                 <s:username>{{ user_name }}</s:username>
@@ -230,61 +239,59 @@ def render_removeTeamMember(user_name, folder_receipt, clean_perms):
                 <s:clean_perms>{{ clean_perms }}</s:clean_perms>
             </s:team>
     """.strip())
-    return template.render(**locals())
+
+
+def render_removeTeamMember(user_name, folder_receipt, clean_perms):
+    if clean_perms:
+        folder_receipt = None
+    clean_perms = str(clean_perms).lower()
+    return _TPL_REMOVE_TEAM_MEMBER.render(user_name=_escape(user_name),
+                                          folder_receipt=folder_receipt and _escape(folder_receipt),
+                                          clean_perms=clean_perms).encode("utf-8")
+
+
+_GET_GROUP_MEMBERS = ('<?xml version="1.0" encoding="utf-8"?>'
+                      '<s:group xmlns:s="http://ns.jianguoyun.com">'
+                      '<s:id>{group_id}</s:id>'
+                      '</s:group>')
 
 
 def render_getGroupMembers(group_id):
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:group xmlns:s="http://ns.jianguoyun.com">
-                <s:id>{{ group_id }}</s:id>
-            </s:group>
-    """.strip())
-    return template.render(**locals())
+    return _GET_GROUP_MEMBERS.format(group_id=_escape(group_id)).encode("utf-8")
 
 
 def render_createGroup(parent_group_id, name, admins, users):
     if isinstance(admins, str):
         admins = [admins]
-    users = users or []
 
     if len(admins) == 0:
         raise ValueError("Empty admins")
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:group xmlns:s="http://ns.jianguoyun.com">
-                <s:id>{{ parent_group_id }}</s:id>
-                <s:name>{{ name }}</s:name>
-                {% for admin in admins %}
-                <s:admin>
-                    <s:username>{{ admin }}</s:username>
-                </s:admin>
-                {% endfor %}
-                {% for user in users %}
-                <s:user>
-                    <s:username>{{ admin }}</s:username>
-                </s:user>
-                {% endfor %}
-            </s:group>
-    """.strip())
-    return template.render(**locals())
+    # Admins are members already, don't list them twice.
+    admins_set = set(admins)
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:group xmlns:s="http://ns.jianguoyun.com">',
+        "<s:id>%s</s:id>" % _escape(parent_group_id),
+        "<s:name>%s</s:name>" % _escape(name),
+    ]
+    parts.extend("<s:admin><s:username>%s</s:username></s:admin>" % _escape(admin) for admin in admins)
+    parts.extend("<s:user><s:username>%s</s:username></s:user>" % _escape(user)
+                 for user in users or [] if user not in admins_set)
+    parts.append("</s:group>")
+    return "".join(parts).encode("utf-8")
 
 
 def render_addMemberToGroup(group_id, users):
     if len(users) == 0:
         raise ValueError("Empty users")
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:group xmlns:s="http://ns.jianguoyun.com">
-                <s:id>{{ group_id }}</s:id>
-                {% for user in users %}
-                <s:user>
-                    <s:username>{{ user }}</s:username>
-                </s:user>
-                {% endfor %}
-            </s:group>
-    """.strip())
-    return template.render(**locals())
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:group xmlns:s="http://ns.jianguoyun.com">',
+        "<s:id>%s</s:id>" % _escape(group_id),
+    ]
+    parts.extend("<s:user><s:username>%s</s:username></s:user>" % _escape(user) for user in users)
+    parts.append("</s:group>")
+    return "".join(parts).encode("utf-8")
 
 
 def render_removeMemberFromGroup(group_id, users, subgroups):
@@ -292,50 +299,29 @@ def render_removeMemberFromGroup(group_id, users, subgroups):
     subgroups = subgroups or []
     if len(users) == len(subgroups) == 0:
         raise ValueError("Empty users and subgroups")
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:group xmlns:s="http://ns.jianguoyun.com">
-                <s:id>{{ group_id }}</s:id>
-                {% for subgroup in subgroups %}
-                <s:subGroup>
-                    <s:id>{{ subgroup }}</s:id>
-                </s:subGroup>
-                {% endfor %}
-                {% for user in users %}
-                <s:user>
-                    <s:username>{{ user }}</s:username>
-                </s:user>
-                {% endfor %}
-            </s:group>
-    """.strip())
-    return template.render(**locals())
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:group xmlns:s="http://ns.jianguoyun.com">',
+        "<s:id>%s</s:id>" % _escape(group_id),
+    ]
+    parts.extend("<s:subGroup><s:id>%s</s:id></s:subGroup>" % _escape(subgroup) for subgroup in subgroups)
+    parts.extend("<s:user><s:username>%s</s:username></s:user>" % _escape(user) for user in users)
+    parts.append("</s:group>")
+    return "".join(parts).encode("utf-8")
 
 
 def render_updateTeamMemberStatus(users):
-    for key in users.keys():
-        users[key] = str(users[key]).lower()
-    template = Template("""
-            <?xml version="1.0" encoding="utf-8"?>
-            <s:team xmlns:s="http://ns.jianguoyun.com">
-                {% for user, disabled in users.items() %}
-                <s:user>
-                    <s:username>{{ user }}</s:username>
-                    <s:disabled>{{ disabled }}</s:disabled>
-                </s:user>
-                {% endfor %}
-            </s:team>
-    """.strip())
-    return template.render(**locals())
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<s:team xmlns:s="http://ns.jianguoyun.com">',
+    ]
+    parts.extend("<s:user><s:username>%s</s:username><s:disabled>%s</s:disabled></s:user>"
+                 % (_escape(user), str(disabled).lower()) for user, disabled in users.items())
+    parts.append("</s:team>")
+    return "".join(parts).encode("utf-8")
 
 
-def render_queryAuditLogs(time_start, time_end, user_name, op_type, file_name):
-    time_start = round(time_start * 1000)
-    time_end = round(time_end * 1000)
-
-    if op_type not in OPERATION_TYPE:
-        raise ValueError("Invalid operation")
-
-    template = Template("""
+_TPL_QUERY_AUDIT_LOGS = _ENV.from_string("""
             <?xml version="1.0" encoding="utf-8"?>
             <s:search xmlns:s="http://ns.jianguoyun.com">
                 <s:time_start>{{ time_start }}</s:time_start>
@@ -351,7 +337,18 @@ def render_queryAuditLogs(time_start, time_end, user_name, op_type, file_name):
                 {% endif %}
             </s:search>
     """.strip())
-    return template.render(**locals())
+
+
+def render_queryAuditLogs(time_start, time_end, user_name, op_type, file_name):
+    time_start = round(time_start * 1000)
+    time_end = round(time_end * 1000)
+
+    if op_type is not None and op_type not in OPERATION_TYPE:
+        raise ValueError("Invalid operation")
+
+    return _TPL_QUERY_AUDIT_LOGS.render(time_start=time_start, time_end=time_end,
+                                        user_name=user_name and _escape(user_name), op_type=op_type,
+                                        file_name=file_name and _escape(file_name)).encode("utf-8")
 
 
 render_func = {
@@ -368,6 +365,7 @@ render_func = {
     "updateTeamInfo": render_updateTeamInfo,
     "createEtpTeamMember": render_createEtpTeamMember,
     "updateTeamMemberStorageQuota": render_updateTeamMemberStorageQuota,
+    "getTeamMemberInfo": render_getTeamMemberInfo,
     "removeTeamMember": render_removeTeamMember,
     "getGroupMembers": render_getGroupMembers,
     "createGroup": render_createGroup,
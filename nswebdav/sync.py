@@ -1,10 +1,37 @@
-from urllib.parse import urljoin
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 
-from nswebdav.base import NutstoreDavBase
+from nswebdav.base import (NutstoreDavBase, _backoff_delay, _chunks, _copy_entities, _merge_audit_logs, _raise_failures,
+                           _time_slices, _TEAM_MEMBER_BATCH)
 from nswebdav.exceptions import NSWebDavHTTPError
 from nswebdav.parse import *
+from nswebdav.render import render_propfind
+
+_ADAPTER_DEFAULTS = {
+    "pool_connections": 10,
+    "pool_maxsize": 20,
+    # Only retry failed connects: nothing has been sent yet, so even a streamed body is safe to resend.
+    "max_retries": Retry(connect=3, read=0, status=0, backoff_factor=0.2),
+}
+
+
+class _PrecomputedBasicAuth(HTTPBasicAuth):
+    # HTTPBasicAuth base64-encodes the credentials on every request.
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        credentials = b64encode(("%s:%s" % (username, password)).encode("latin1"))
+        self._header = "Basic " + credentials.decode("ascii")
+
+    def __call__(self, r):
+        r.headers["Authorization"] = self._header
+        return r
 
 
 class NutstoreDav(NutstoreDavBase):
@@ -20,20 +47,86 @@ class NutstoreDav(NutstoreDavBase):
 
     def __init__(self, base_url="https://dav.jianguoyun.com", dav_url="/dav", operation_url="/nsdav"):
         super().__init__(base_url, dav_url, operation_url)
-        self._client = requests.Session()
 
-    def _get_auth_tuple(self, auth_tuple=None):
-        return auth_tuple or self._auth_tuple
+    def _default_client(self):
+        adapter_kwargs = dict(_ADAPTER_DEFAULTS, **self._connector_kwargs)
+        adapter = HTTPAdapter(**adapter_kwargs)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
-    def close(self):
-        self._client.close()
-
-    def ls(self, path, auth_tuple=None, client=None):
-        response = self._perform_dav_request("PROPFIND", auth_tuple, client, path=path)
+    def _make_auth(self, auth_tuple):
+        return _PrecomputedBasicAuth(*auth_tuple)
 
-        if response.status_code == 207:
-            return parse_ls(response.content)
-        raise NSWebDavHTTPError(response.status_code, response.content)
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _map(self, func, iterable, concurrency, return_exceptions=False):
+        if self._client is None:
+            # Create the shared client before threads race to do it.
+            self._get_client()
+        if return_exceptions:
+            # Like ``asyncio.gather``, so one failure doesn't hide the others.
+            def call(item, func=func):
+                try:
+                    return func(item)
+                except Exception as e:
+                    return e
+            func = call
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(func, iterable))
+
+    def _with_retry(self, func, retries, backoff=0.25):
+        # Always make at least one attempt.
+        attempts = max(retries, 1)
+        for attempt in range(attempts):
+            try:
+                return func()
+            except NSWebDavHTTPError as e:
+                if e.code < 500 or attempt == attempts - 1:
+                    raise
+            time.sleep(_backoff_delay(backoff, attempt))
+
+    def ls(self, path, auth_tuple=None, client=None, props=None):
+        key = self._ls_cache_key(path, props, auth_tuple, client)
+        cached = self._ls_cache_get(key)
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        data = render_propfind(props) if props else None
+        response = self._perform_dav_request("PROPFIND", auth_tuple, client, path=path, data=data,
+                                             headers=headers, stream=True)
+
+        # Always close the streamed response, or a failed parse keeps its connection out of the pool.
+        try:
+            if response.status_code == 304 and cached is not None:
+                return _copy_entities(cached[1])
+            if response.status_code == 207:
+                # Feed the raw body to the parser as it arrives rather than buffering the whole listing.
+                response.raw.decode_content = True
+                result = parse_ls(response.raw)
+                self._ls_cache_set(key, response.headers.get("ETag"), result)
+                return result
+            raise NSWebDavHTTPError(response.status_code, response.content)
+        finally:
+            response.close()
+
+    def ls_tree(self, path, depth="infinity", auth_tuple=None, client=None, props=None):
+        data = render_propfind(props) if props else None
+        response = self._perform_dav_request("PROPFIND", auth_tuple, client, path=path, data=data,
+                                             headers={"Depth": depth}, stream=True)
+
+        try:
+            if response.status_code == 207:
+                response.raw.decode_content = True
+                return parse_ls(response.raw)
+            raise NSWebDavHTTPError(response.status_code, response.content)
+        finally:
+            response.close()
+
+    def ls_many(self, paths, concurrency=8, auth_tuple=None, client=None, props=None):
+        return self._map(lambda path: self.ls(path, auth_tuple, client, props), paths, concurrency)
 
     def mkdir(self, path, auth_tuple=None, client=None):
         response = self._perform_dav_request("MKCOL", auth_tuple, client, path=path)
@@ -51,22 +144,41 @@ class NutstoreDav(NutstoreDavBase):
             return "Overwrite"
         raise NSWebDavHTTPError(response.status_code, response.content)
 
-    def download(self, path, auth_tuple=None, client=None):
-        response = self._perform_dav_request("GET", auth_tuple, client, path=path)
+    def download(self, path, auth_tuple=None, client=None, fp=None, chunk_size=65536):
+        response = self._perform_dav_request("GET", auth_tuple, client, path=path, stream=fp is not None)
 
         if response.status_code == 200:
-            return response.content
+            if fp is None:
+                return response.content
+            written = 0
+            for chunk in response.iter_content(chunk_size):
+                fp.write(chunk)
+                written += len(chunk)
+            return written
         raise NSWebDavHTTPError(response.status_code, response.content)
 
+    def iter_download(self, path, chunk_size=65536, auth_tuple=None, client=None):
+        response = self._perform_dav_request("GET", auth_tuple, client, path=path, stream=True)
+
+        if response.status_code == 200:
+            return response.iter_content(chunk_size)
+        raise NSWebDavHTTPError(response.status_code, response.content)
+
+    def mget(self, paths, concurrency=8, auth_tuple=None, client=None):
+        return self._map(lambda path: self.download(path, auth_tuple, client), paths, concurrency)
+
+    def mput(self, items, concurrency=8, auth_tuple=None, client=None):
+        return self._map(lambda item: self.upload(item[0], item[1], auth_tuple, client), items, concurrency)
+
     def mv(self, from_path, to_path, auth_tuple=None, client=None):
-        response = self._perform_dav_request("MOVE", auth_tuple, client, from_path=from_path, to_path=to_path)
+        response = self._perform_dav_move_request("MOVE", auth_tuple, client, from_path=from_path, to_path=to_path)
 
         if response.status_code == 201:
             return True
         raise NSWebDavHTTPError(response.status_code, response.content)
 
     def cp(self, from_path, to_path, auth_tuple=None, client=None):
-        response = self._perform_dav_request("COPY", auth_tuple, client, from_path=from_path, to_path=to_path)
+        response = self._perform_dav_move_request("COPY", auth_tuple, client, from_path=from_path, to_path=to_path)
 
         if response.status_code == 201:
             return True
@@ -79,6 +191,9 @@ class NutstoreDav(NutstoreDavBase):
             return True
         raise NSWebDavHTTPError(response.status_code, response.content)
 
+    def rm_many(self, paths, concurrency=8, auth_tuple=None, client=None):
+        return self._map(lambda path: self.rm(path, auth_tuple, client), paths, concurrency)
+
     def share(self, path, users=None, groups=None, downloadable=True, auth_tuple=None, client=None):
         path = self._dav_url + path
         response = self._perform_operation_request("pubObject", auth_tuple, client,
@@ -140,12 +255,18 @@ class NutstoreDav(NutstoreDavBase):
         raise NSWebDavHTTPError(response.status_code, response.content)
 
     def search(self, keywords, path, auth_tuple=None, client=None):
+        key = self._search_cache_key(keywords, path, auth_tuple, client)
+        result = self._search_cache_get(key)
+        if result is not None:
+            return result
         if path:
             path = self._dav_url + path
         response = self._perform_operation_request("search", auth_tuple, client,
                                                    keywords=keywords, path=path)
         if response.status_code == 207:
-            return parse_search(response.content)
+            result = parse_search(response.content)
+            self._search_cache_set(key, result)
+            return result
         raise NSWebDavHTTPError(response.status_code, response.content)
 
     def get_content_url(self, path, platform="desktop", link_type="download", auth_tuple=None, client=None):
@@ -169,8 +290,7 @@ class NutstoreDav(NutstoreDavBase):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/getUserInfo"
+        url = self._operation_urls["getUserInfo"]
         response = client.request("GET", url, auth=auth_tuple)
 
         if response.status_code == 200:
@@ -188,34 +308,41 @@ class NutstoreDav(NutstoreDavBase):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/getTeamMembers"
+        url = self._operation_urls["getTeamMembers"]
         response = client.request("GET", url, auth=auth_tuple)
 
         if response.status_code == 200:
             return parse_team_members(response.content)
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def create_team_member(self, users, auth_tuple=None, client=None):
         response = self._perform_operation_request("createEtpTeamMember", auth_tuple, client,
                                                    users=users)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
+
+    def create_team_members(self, users, concurrency=8, retries=3, auth_tuple=None, client=None):
+        batches = _chunks(users, _TEAM_MEMBER_BATCH)
+        results = self._map(lambda batch: self._with_retry(partial(self.create_team_member, batch, auth_tuple, client),
+                                                           retries),
+                            batches, concurrency, return_exceptions=True)
+        _raise_failures(batches, results)
+        return True
 
     def update_team_member_storage_quota(self, user_name, storage_quota, auth_tuple=None, client=None):
         response = self._perform_operation_request("updateTeamMemberStorageQuota", auth_tuple, client,
                                                    user_name=user_name, storage_quota=storage_quota)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def get_team_member_info(self, user_name, auth_tuple=None, client=None):
         response = self._perform_operation_request("getTeamMemberInfo", auth_tuple, client,
                                                    user_name=user_name)
         if response.status_code == 200:
-            return parse_team_member_info(response.content())
-        raise NSWebDavHTTPError(response.status_code, response.content())
+            return parse_team_member_info(response.content)
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def remove_team_member(self, user_name, folder_receipt, clean_perms=False, auth_tuple=None, client=None):
         response = self._perform_operation_request("removeTeamMember", auth_tuple, client,
@@ -223,55 +350,54 @@ class NutstoreDav(NutstoreDavBase):
                                                    clean_perms=clean_perms)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def get_group_members(self, group_id, auth_tuple=None, client=None):
         response = self._perform_operation_request("getGroupMembers", auth_tuple, client,
                                                    group_id=group_id)
         if response.status_code == 200:
-            return parse_group_members(response.content())
-        raise NSWebDavHTTPError(response.status_code, response.content())
+            return parse_group_members(response.content)
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def create_group(self, parent_group_id, name, admins, users=None, auth_tuple=None, client=None):
         response = self._perform_operation_request("createGroup", auth_tuple, client,
                                                    parent_group_id=parent_group_id, name=name, admins=admins,
                                                    users=users)
         if response.status_code == 200:
-            return parse_created_group(response.content())
-        raise NSWebDavHTTPError(response.status_code, response.content())
+            return parse_created_group(response.content)
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def add_member_to_group(self, group_id, users, auth_tuple=None, client=None):
         response = self._perform_operation_request("addMemberToGroup", auth_tuple, client,
                                                    group_id=group_id, users=users)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def remove_member_from_group(self, group_id, users=None, subgroups=None, auth_tuple=None, client=None):
         response = self._perform_operation_request("removeMemberFromGroup", auth_tuple, client,
                                                    group_id=group_id, users=users, subgroups=subgroups)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def dismiss_team(self, auth_tuple=None, client=None):
         auth_tuple = self._get_auth_tuple(auth_tuple)
         client = self._get_client(client)
 
-        root_url = urljoin(self._base_url, self._operation_url)
-        url = root_url + "/dismissTeam"
+        url = self._operation_urls["dismissTeam"]
         response = client.request("POST", url, auth=auth_tuple)
 
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def update_team_member_status(self, users, auth_tuple=None, client=None):
         response = self._perform_operation_request("updateTeamMemberStatus", auth_tuple, client,
                                                    users=users)
         if response.status_code == 204:
             return True
-        raise NSWebDavHTTPError(response.status_code, response.content())
+        raise NSWebDavHTTPError(response.status_code, response.content)
 
     def query_audit_logs(self, time_start, time_end, user_name=None, op_type=None, file_name=None,
                          auth_tuple=None, client=None):
@@ -279,5 +405,14 @@ class NutstoreDav(NutstoreDavBase):
                                                    time_start=time_start, time_end=time_end, user_name=user_name,
                                                    op_type=op_type, file_name=file_name)
         if response.status_code == 200:
-            return parse_audit_logs(response.content())
-        raise NSWebDavHTTPError(response.status_code, response.content())
+            return parse_audit_logs(response.content)
+        raise NSWebDavHTTPError(response.status_code, response.content)
+
+    def query_audit_logs_range(self, time_start, time_end, user_name=None, op_type=None, file_name=None,
+                               slices=8, concurrency=4, retries=3, auth_tuple=None, client=None):
+        parts = _time_slices(time_start, time_end, slices)
+        results = self._map(lambda bounds: self._with_retry(partial(self.query_audit_logs, bounds[0], bounds[1],
+                                                                    user_name, op_type, file_name,
+                                                                    auth_tuple, client), retries),
+                            parts, concurrency, return_exceptions=True)
+        return _merge_audit_logs(_raise_failures(parts, results))
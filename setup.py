@@ -1,11 +1,8 @@
 from setuptools import setup, find_packages
 from nswebdav import __version__
 
-try:
-    import pypandoc
-    long_description = pypandoc.convert('README.md', 'rst')
-except(IOError, ImportError):
-    long_description = open('README.md').read()
+with open('README.md', encoding='utf-8') as f:
+    long_description = f.read()
 
 setup(
     name='nswebdav',
@@ -14,6 +11,7 @@ setup(
     license='MIT',
     description='A python implementation for nutstore(jianguoyun) webdav',
     long_description=long_description,
+    long_description_content_type='text/markdown',
     author='Sraw',
     author_email='lzyl888@gmail.com',
     url='https://github.com/Sraw/nswebdav',